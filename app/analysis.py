@@ -1,74 +1,123 @@
 import google.generativeai as genai
-from typing import List, Dict, Any
-from app.models import MarketData, TradeOpportunity, AnalysisResponse
+from google.api_core.exceptions import ResourceExhausted, ServerError
+from typing import List, Dict, Any, Tuple
+from app.models import MarketData, TradeOpportunity, AnalysisResponse, trade_opportunities_adapter
 from app.config import settings
-import json
+from app.concurrency import AIMDLimiter
+from app.rate_limit import too_many_requests
+from cachetools import TTLCache
+import orjson
+import re
 from datetime import datetime
 
+# Gemini results keyed on (sector, market data fingerprint)
+_analysis_cache = TTLCache(maxsize=64, ttl=settings.cache_ttl)
+
+# Fenced code blocks in a Gemini response; a missing closing fence runs to the end
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)(?:```|\Z)", re.DOTALL)
+_FENCE_RE = re.compile(r"```\s*(.*?)(?:```|\Z)", re.DOTALL)
+
+# Sector-independent instructions, kept ahead of the per-request data so every
+# prompt shares the same prefix (eligible for provider-side prompt caching)
+_PROMPT_HEAD = """Analyze the market data below for the given sector in India and provide:
+1. A brief summary of current market conditions
+2. 3-5 key market trends
+3. 3-5 specific trade opportunities with reasoning, risk level (low/medium/high), and time horizon
+4. 3-5 potential risks
+
+Respond in JSON format with this structure:
+{
+    "summary": "string",
+    "market_trends": ["trend1", "trend2", ...],
+    "trade_opportunities": [
+        {
+            "opportunity": "string",
+            "reasoning": "string",
+            "risk_level": "low/medium/high",
+            "time_horizon": "short/medium/long-term"
+        }
+    ],
+    "risks": ["risk1", "risk2", ...]
+}
+
+"""
+
+# Gemini model, built once by initialize_gemini() at startup
+_model = None
+
+# Bounds concurrent Gemini calls, adapting to upstream latency and 429s
+gemini_limiter = AIMDLimiter(
+    initial=settings.gemini_initial_concurrency,
+    max_limit=settings.gemini_max_concurrency,
+    target_latency=settings.gemini_target_latency,
+)
+
 def initialize_gemini():
     """Initialize Gemini API"""
+    global _model
     if settings.gemini_api_key:
         genai.configure(api_key=settings.gemini_api_key)
+        _model = genai.GenerativeModel('gemini-pro')
         return True
     return False
 
-def analyze_with_gemini(sector: str, market_data: List[MarketData]) -> Dict[str, Any]:
+async def analyze_with_gemini(sector: str, market_data: List[MarketData]) -> Tuple[Dict[str, Any], bool]:
     """
     Use Gemini API to analyze market data and generate insights
+    
+    Returns (analysis, degraded); degraded is True when Gemini is configured
+    but the call failed and mock analysis was substituted.
     """
-    if not initialize_gemini():
-        return generate_mock_analysis(sector, market_data)
+    if _model is None:
+        return generate_mock_analysis(sector, market_data), False
+    
+    cache_key = (sector, hash(tuple((item.title, item.date) for item in market_data)))
+    cached = _analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached, False
     
     try:
         # Prepare prompt for Gemini
-        prompt = f"""
-        Analyze the following market data for the {sector} sector in India and provide:
-        1. A brief summary of current market conditions
-        2. 3-5 key market trends
-        3. 3-5 specific trade opportunities with reasoning, risk level (low/medium/high), and time horizon
-        4. 3-5 potential risks
-        
-        Market Data:
-        {json.dumps([item.dict() for item in market_data], indent=2)}
-        
-        Respond in JSON format with this structure:
-        {{
-            "summary": "string",
-            "market_trends": ["trend1", "trend2", ...],
-            "trade_opportunities": [
-                {{
-                    "opportunity": "string",
-                    "reasoning": "string",
-                    "risk_level": "low/medium/high",
-                    "time_horizon": "short/medium/long-term"
-                }}
-            ],
-            "risks": ["risk1", "risk2", ...]
-        }}
-        """
+        payload = orjson.dumps(
+            [item.model_dump() for item in market_data], option=orjson.OPT_INDENT_2
+        ).decode()
+        prompt = f"{_PROMPT_HEAD}Sector: {sector}\n\nMarket Data:\n{payload}\n"
         
         # Use Gemini model
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
+        async with gemini_limiter.slot():
+            response = await _model.generate_content_async(prompt)
         
         # Parse response (Gemini might return markdown with JSON)
         response_text = response.text
         
-        # Extract JSON from response
-        if '```json' in response_text:
-            json_str = response_text.split('```json')[1].split('```')[0]
-        elif '```' in response_text:
-            json_str = response_text.split('```')[1].split('```')[0]
-        else:
-            json_str = response_text
+        # Extract JSON from response, preferring a json-tagged fence
+        match = _JSON_FENCE_RE.search(response_text) or _FENCE_RE.search(response_text)
+        json_str = match.group(1) if match else response_text
+        
+        analysis = orjson.loads(json_str)
+        
+        # Check the shape before caching so a malformed reply is retried, not pinned
+        if not isinstance(analysis, dict):
+            raise ValueError(f"expected a JSON object, got {type(analysis).__name__}")
+        trade_opportunities_adapter.validate_python(analysis.get("trade_opportunities", []))
         
-        analysis = json.loads(json_str)
+        _analysis_cache[cache_key] = analysis
+        return analysis, False
         
+    except ResourceExhausted:
+        gemini_limiter.backoff()
+        raise too_many_requests(
+            "analysis_busy",
+            f"Analysis service is busy. Try again in {settings.gemini_retry_after} seconds.",
+            settings.gemini_retry_after
+        )
+    except ServerError as e:
+        gemini_limiter.backoff()
+        print(f"Gemini analysis failed: {e}")
     except Exception as e:
         print(f"Gemini analysis failed: {e}")
-        analysis = generate_mock_analysis(sector, market_data)
     
-    return analysis
+    return generate_mock_analysis(sector, market_data), True
 
 def generate_mock_analysis(sector: str, market_data: List[MarketData]) -> Dict[str, Any]:
     """Generate mock analysis if Gemini fails"""
@@ -107,36 +156,35 @@ def generate_markdown_report(sector: str, analysis: Dict[str, Any], market_data:
     """Generate structured markdown report"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    markdown = f"""# Market Analysis Report: {sector.title()} Sector
-**Generated:** {timestamp}
-
-## Executive Summary
-{analysis.get('summary', '')}
-
-## Market Trends
-"""
+    parts = [
+        f"# Market Analysis Report: {sector.title()} Sector\n",
+        f"**Generated:** {timestamp}\n\n",
+        "## Executive Summary\n",
+        f"{analysis.get('summary', '')}\n\n",
+        "## Market Trends\n",
+    ]
     
     for trend in analysis.get('market_trends', []):
-        markdown += f"- {trend}\n"
+        parts.append(f"- {trend}\n")
     
-    markdown += "\n## Key Market Information\n"
+    parts.append("\n## Key Market Information\n")
     for data in market_data[:5]:  # Show top 5 news items
-        markdown += f"### {data.title}\n"
-        markdown += f"**Source:** {data.source} | **Date:** {data.date}\n"
-        markdown += f"{data.snippet}\n\n"
+        parts.append(f"### {data.title}\n")
+        parts.append(f"**Source:** {data.source} | **Date:** {data.date}\n")
+        parts.append(f"{data.snippet}\n\n")
     
-    markdown += "## Trade Opportunities\n"
+    parts.append("## Trade Opportunities\n")
     for i, opp in enumerate(analysis.get('trade_opportunities', []), 1):
-        markdown += f"### Opportunity {i}: {opp.get('opportunity', '')}\n"
-        markdown += f"- **Reasoning:** {opp.get('reasoning', '')}\n"
-        markdown += f"- **Risk Level:** {opp.get('risk_level', '').title()}\n"
-        markdown += f"- **Time Horizon:** {opp.get('time_horizon', '')}\n\n"
+        parts.append(f"### Opportunity {i}: {opp.get('opportunity', '')}\n")
+        parts.append(f"- **Reasoning:** {opp.get('reasoning', '')}\n")
+        parts.append(f"- **Risk Level:** {opp.get('risk_level', '').title()}\n")
+        parts.append(f"- **Time Horizon:** {opp.get('time_horizon', '')}\n\n")
     
-    markdown += "## Potential Risks\n"
+    parts.append("## Potential Risks\n")
     for risk in analysis.get('risks', []):
-        markdown += f"- ⚠️ {risk}\n"
+        parts.append(f"- ⚠️ {risk}\n")
     
-    markdown += "\n---\n"
-    markdown += "*Report generated by Trade Opportunities API. This is for informational purposes only.*"
+    parts.append("\n---\n")
+    parts.append("*Report generated by Trade Opportunities API. This is for informational purposes only.*")
     
-    return markdown
\ No newline at end of file
+    return "".join(parts)
@@ -1,24 +1,43 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
+from jwt import InvalidTokenError
 from fastapi import HTTPException, status
+import bcrypt
 from app.config import settings
 from app.models import TokenData, User
 
-# Simple in-memory user store with plain passwords for demo
+# bcrypt only looks at the first 72 bytes; longer passwords are rejected outright
+_BCRYPT_MAX_BYTES = 72
+
+def _hash_password(password: str) -> bytes:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+
+def _verify_password(password: str, hashed_password: bytes) -> bool:
+    encoded = password.encode("utf-8")
+    if len(encoded) > _BCRYPT_MAX_BYTES:
+        # Still pay for a hash so the rejection takes the same time
+        bcrypt.checkpw(encoded[:_BCRYPT_MAX_BYTES], hashed_password)
+        return False
+    return bcrypt.checkpw(encoded, hashed_password)
+
+# Simple in-memory user store; demo passwords are hashed once at startup
 fake_users_db = {
     "guest": {
         "username": "guest",
-        "password": "guest",  # Plain text for demo
+        "hashed_password": _hash_password("guest"),
         "disabled": False,
     },
     "trader": {
         "username": "trader", 
-        "password": "trading123",  # Plain text for demo
+        "hashed_password": _hash_password("trading123"),
         "disabled": False,
     }
 }
 
+# Verified against for unknown users so response time does not reveal valid usernames
+_DUMMY_HASH = _hash_password("dummy-password")
+
 def get_user(username: str):
     if username in fake_users_db:
         user_dict = fake_users_db[username]
@@ -28,9 +47,9 @@ def get_user(username: str):
 def authenticate_user(username: str, password: str):
     user_data = fake_users_db.get(username)
     if not user_data:
+        _verify_password(password, _DUMMY_HASH)
         return False
-    # Simple plain text comparison for demo
-    if password != user_data["password"]:
+    if not _verify_password(password, user_data["hashed_password"]):
         return False
     return User(username=user_data["username"], disabled=user_data.get("disabled", False))
 
@@ -44,21 +63,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-async def get_current_user(token: str):
-    credentials_exception = HTTPException(
+# Resolved once; read on every authenticated request
+_SECRET_KEY = settings.secret_key
+_ALGORITHMS = [settings.algorithm]
+_DECODE_OPTIONS = {"require": ["exp", "sub"]}
+_CREDENTIALS_HEADERS = {"WWW-Authenticate": "Bearer"}
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+        headers=_CREDENTIALS_HEADERS,
     )
+
+async def get_current_user(token: str):
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        payload = jwt.decode(token, _SECRET_KEY, algorithms=_ALGORITHMS, options=_DECODE_OPTIONS)
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
         token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
+    except InvalidTokenError:
+        raise _credentials_exception()
     user = get_user(username=token_data.username)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+    return user
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+# Adaptive concurrency limiter (additive increase, multiplicative decrease)
+class AIMDLimiter:
+    def __init__(self, initial: int, max_limit: int, target_latency: float,
+                 min_limit: int = 1, window: int = 10, smoothing: float = 0.2):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.window = window
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.avg_latency = None
+        self.completions = 0
+        self.condition = asyncio.Condition()
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot, then hold it for the duration of the call"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+            self.record_latency(time.monotonic() - start)
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+    
+    def record_latency(self, latency: float):
+        """Update the latency average and adjust the limit every window completions"""
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency += self.smoothing * (latency - self.avg_latency)
+        
+        self.completions += 1
+        if self.completions % self.window == 0:
+            if self.avg_latency < self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 0.5)
+            else:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+    
+    def backoff(self):
+        """Halve the limit after an upstream overload signal"""
+        self.limit = max(self.min_limit, self.limit * 0.5)
@@ -1,5 +1,6 @@
+from pydantic import PrivateAttr
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Optional
 
 class Settings(BaseSettings):
     app_name: str = "Trade Opportunities API"
@@ -13,13 +14,42 @@ class Settings(BaseSettings):
     # Rate limiting
     rate_limit_requests: int = 10
     rate_limit_period: int = 60  # seconds
+    redis_url: Optional[str] = None  # shared limiter across workers when set
+    redis_timeout: float = 0.5  # seconds; connect/read timeout before falling back
+    
+    # Gemini admission control
+    gemini_initial_concurrency: int = 4
+    gemini_max_concurrency: int = 16
+    gemini_target_latency: float = 5.0  # seconds
+    gemini_retry_after: int = 30  # seconds
+    
+    # Caching
+    cache_ttl: int = 900  # seconds
+    session_cache_size: int = 1024
+    http_cache_max_age: int = 600  # seconds, sent in Cache-Control on /analyze
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # Derived from allowed_sectors once, in model_post_init
+    _allowed_sectors_set: frozenset = PrivateAttr(default=frozenset())
+    _sector_error_message: str = PrivateAttr(default="")
+    
     class Config:
         env_file = ".env"
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._allowed_sectors_set = frozenset(sector.lower() for sector in self.allowed_sectors)
+        self._sector_error_message = f"Sector not supported. Allowed sectors: {', '.join(self.allowed_sectors)}"
+    
+    @property
+    def allowed_sectors_set(self) -> frozenset:
+        return self._allowed_sectors_set
+    
+    @property
+    def sector_error_message(self) -> str:
+        return self._sector_error_message
 
 settings = Settings()
\ No newline at end of file
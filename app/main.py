@@ -1,18 +1,24 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
 import logging
+import orjson
 from datetime import datetime
+from cachetools import LRUCache, TTLCache
+from redis.exceptions import RedisError
 
 from app.config import settings
 from app.auth import authenticate_user, create_access_token, get_current_user
-from app.models import Token, User, AnalysisRequest, AnalysisResponse, TradeOpportunity
-from app.rate_limit import check_rate_limit, rate_limiter
+from app.models import Token, User, AnalysisRequest, AnalysisResponse, MarketData, TradeOpportunity, trade_opportunities_adapter
+from app.rate_limit import check_rate_limit, rate_limiter, redis_rate_limiter
+from app.redis_client import redis_client, close_redis
 from app.search import search_market_data
-from app.analysis import analyze_with_gemini, generate_markdown_report
+from app.analysis import initialize_gemini, analyze_with_gemini, generate_mock_analysis, generate_markdown_report, gemini_limiter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -35,8 +41,41 @@ app.add_middleware(
 
 security = HTTPBearer()
 
-# In-memory session tracking
-sessions = {}
+# In-memory session tracking, bounded to the most recent users
+sessions = LRUCache(maxsize=settings.session_cache_size)
+analysis_counts = LRUCache(maxsize=settings.session_cache_size)
+
+# last_analysis is only refreshed every N analyses to keep writes off the hot path
+SESSION_WRITE_INTERVAL = 10
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
+class PipelineResult(NamedTuple):
+    analysis: Dict[str, Any]
+    market_data: List[MarketData]
+    trade_opportunities: List[TradeOpportunity]  # validated from analysis
+    markdown_report: str
+    markdown_bytes: bytes  # UTF-8 report, served as-is by the download endpoint
+    degraded: bool  # built from fallback search data or mock analysis
+
+# Pipeline results per sector, so repeat requests skip search, analysis and rendering.
+# Degraded results are never cached, so a transient upstream failure is not pinned.
+_pipeline_cache = TTLCache(maxsize=64, ttl=settings.cache_ttl)
+
+# Serialized /analyze bodies and ETags, stored with the pipeline result they came from
+_response_cache = TTLCache(maxsize=64, ttl=settings.cache_ttl)
+
+@app.on_event("startup")
+async def startup():
+    if initialize_gemini():
+        logger.info("Gemini model initialized")
+    else:
+        logger.info("No Gemini API key configured, using mock analysis")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_redis()
 
 # Pydantic model for login
 class LoginRequest(BaseModel):
@@ -61,7 +100,8 @@ async def login_for_access_token(form_data: LoginRequest):
     Get access token for API authentication
     Example: {"username": "guest", "password": "guest"}
     """
-    user = authenticate_user(form_data.username, form_data.password)
+    # bcrypt verification is CPU-bound; keep it off the event loop
+    user = await asyncio.to_thread(authenticate_user, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,25 +119,19 @@ async def login_for_access_token(form_data: LoginRequest):
     
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/analyze/{sector}", response_model=AnalysisResponse)
-async def analyze_sector(
+async def _authorize(
     sector: str,
     request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-):
-    """
-    Analyze a specific sector and return trade opportunities
-    
-    - **sector**: Name of the sector to analyze (e.g., pharmaceuticals, technology, agriculture)
-    - Returns structured market analysis with trade opportunities
-    """
+    credentials: HTTPAuthorizationCredentials
+) -> Tuple[str, User]:
+    """Validate the sector, authenticate the caller and apply rate limiting"""
     
     # Input validation
     sector_lower = sector.lower()
-    if sector_lower not in settings.allowed_sectors:
+    if sector_lower not in settings.allowed_sectors_set:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Sector not supported. Allowed sectors: {', '.join(settings.allowed_sectors)}"
+            detail=settings.sector_error_message
         )
     
     # Authentication
@@ -111,50 +145,169 @@ async def analyze_sector(
     
     # Rate limiting
     user_identifier = f"{current_user.username}_{request.client.host}"
-    check_rate_limit(request, user_identifier)
+    await check_rate_limit(request, user_identifier)
     
+    return sector_lower, current_user
+
+async def _run_pipeline(
+    sector_lower: str,
+    current_user: User
+) -> PipelineResult:
+    """Return the (cached) pipeline result for a sector and record the session"""
     try:
-        logger.info(f"Analyzing sector: {sector_lower} for user: {current_user.username}")
-        
-        # Step 1: Search for market data
-        market_data = await search_market_data(sector_lower)
+        result = _pipeline_cache.get(sector_lower)
+        if result is None:
+            result = await _compute_pipeline(sector_lower, current_user)
+            if not result.degraded:
+                _pipeline_cache[sector_lower] = result
         
-        # Step 2: Analyze with AI
-        analysis = analyze_with_gemini(sector_lower, market_data)
+        _record_analysis(current_user.username)
         
-        # Step 3: Generate markdown report
-        markdown_report = generate_markdown_report(sector_lower, analysis, market_data)
+        return result
         
-        # Step 4: Prepare response
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error analyzing sector {sector_lower}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Analysis failed: {str(e)}"
+        )
+
+def _record_analysis(username: str):
+    """Count an analysis for the user, coalescing session and Redis writes"""
+    count = analysis_counts.get(username, 0) + 1
+    analysis_counts[username] = count
+    
+    session = sessions.get(username)
+    if session is not None and count % SESSION_WRITE_INTERVAL == 1:
+        session["last_analysis"] = datetime.now().isoformat()
+    
+    if redis_client is not None:
+        task = asyncio.create_task(_persist_analysis_count(username))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def _persist_analysis_count(username: str):
+    try:
+        await redis_client.hincrby(f"session:{username}", "analysis_count", 1)
+    except RedisError as e:
+        logger.warning(f"Failed to persist analysis count for {username}: {e}")
+
+async def _compute_pipeline(sector_lower: str, current_user: User) -> PipelineResult:
+    """Run search, AI analysis and report rendering for a sector"""
+    logger.info(f"Analyzing sector: {sector_lower} for user: {current_user.username}")
+    
+    # Step 1: Search for market data
+    market_data, search_degraded = await search_market_data(sector_lower)
+    
+    # Step 2: Analyze with AI
+    analysis, analysis_degraded = await analyze_with_gemini(sector_lower, market_data)
+    
+    # Validate opportunities now so a result that cannot be encoded is never cached
+    try:
+        if not isinstance(analysis, dict):
+            raise ValueError(f"expected an analysis object, got {type(analysis).__name__}")
+        trade_opportunities = trade_opportunities_adapter.validate_python(
+            analysis.get("trade_opportunities", [])
+        )
+    except ValueError as e:
+        logger.error(f"Invalid analysis for sector {sector_lower}: {str(e)}")
+        analysis, analysis_degraded = generate_mock_analysis(sector_lower, market_data), True
+        trade_opportunities = trade_opportunities_adapter.validate_python(
+            analysis["trade_opportunities"]
+        )
+    
+    # Step 3: Generate markdown report
+    markdown_report = generate_markdown_report(sector_lower, analysis, market_data)
+    
+    return PipelineResult(
+        analysis,
+        market_data,
+        trade_opportunities,
+        markdown_report,
+        markdown_report.encode("utf-8"),
+        degraded=search_degraded or analysis_degraded
+    )
+
+def _encode_response(sector_lower: str, result: PipelineResult) -> Tuple[bytes, str]:
+    """Build, serialize and ETag the AnalysisResponse for a pipeline result (cached)"""
+    cached = _response_cache.get(sector_lower)
+    if cached is not None and cached[0] is result:
+        return cached[1], cached[2]
+    
+    try:
         response_data = AnalysisResponse(
             sector=sector_lower,
             timestamp=datetime.now().isoformat(),
-            summary=analysis.get("summary", ""),
-            market_trends=analysis.get("market_trends", []),
-            key_news=market_data[:5],  # Top 5 news items
-            trade_opportunities=[
-                TradeOpportunity(**opp) for opp in analysis.get("trade_opportunities", [])
-            ],
-            risks=analysis.get("risks", []),
-            markdown_report=markdown_report
+            summary=result.analysis.get("summary", ""),
+            market_trends=result.analysis.get("market_trends", []),
+            key_news=result.market_data[:5],  # Top 5 news items
+            trade_opportunities=result.trade_opportunities,
+            risks=result.analysis.get("risks", []),
+            markdown_report=result.markdown_report
         )
-        
-        # Update session
-        if current_user.username in sessions:
-            sessions[current_user.username]["last_analysis"] = datetime.now().isoformat()
-            sessions[current_user.username]["analysis_count"] = \
-                sessions[current_user.username].get("analysis_count", 0) + 1
-        
-        return response_data
-        
     except Exception as e:
-        logger.error(f"Error analyzing sector {sector}: {str(e)}")
+        logger.error(f"Error building analysis for sector {sector_lower}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Analysis failed: {str(e)}"
         )
+    
+    # Already validated while building; dump straight to orjson without a second pass
+    body = orjson.dumps(response_data.model_dump())
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    _response_cache[sector_lower] = (result, body, etag)
+    return body, etag
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+@app.get(
+    "/analyze/{sector}",
+    response_model=None,
+    responses={200: {"model": AnalysisResponse}}
+)
+async def analyze_sector(
+    sector: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Analyze a specific sector and return trade opportunities
+    
+    - **sector**: Name of the sector to analyze (e.g., pharmaceuticals, technology, agriculture)
+    - Returns structured market analysis with trade opportunities
+    """
+    sector_lower, current_user = await _authorize(sector, request, credentials)
+    result = await _run_pipeline(sector_lower, current_user)
+    body, etag = _encode_response(sector_lower, result)
+    
+    # Fallback content must not be reused by clients either
+    if result.degraded:
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"Cache-Control": "no-store"}
+        )
+    
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.http_cache_max_age}"
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@app.get("/analyze/{sector}/markdown", response_class=PlainTextResponse)
+@app.get(
+    "/analyze/{sector}/markdown",
+    response_class=Response,
+    responses={200: {"content": {"text/markdown": {"schema": {"type": "string"}}}}}
+)
 async def analyze_sector_markdown(
     sector: str,
     request: Request,
@@ -163,11 +316,13 @@ async def analyze_sector_markdown(
     """
     Get analysis report in markdown format (downloadable .md file)
     """
-    analysis = await analyze_sector(sector, request, credentials)
-    return PlainTextResponse(
-        content=analysis.markdown_report,
+    sector_lower, current_user = await _authorize(sector, request, credentials)
+    result = await _run_pipeline(sector_lower, current_user)
+    return Response(
+        content=result.markdown_bytes,
+        media_type="text/markdown; charset=utf-8",
         headers={
-            "Content-Disposition": f"attachment; filename={sector}_analysis_{datetime.now().strftime('%Y%m%d')}.md"
+            "Content-Disposition": f"attachment; filename={sector_lower}_analysis_{datetime.now().strftime('%Y%m%d')}.md"
         }
     )
 
@@ -177,14 +332,20 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "rate_limiter_status": "active"
+        "rate_limiter_status": "active",
+        "rate_limiter_backend": "redis" if redis_rate_limiter is not None else "memory",
+        "gemini_in_flight": gemini_limiter.in_flight,
+        "gemini_concurrency_limit": int(gemini_limiter.limit)
     }
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
+    # Structured error bodies (e.g. 429s) are returned as-is at the top level
+    content = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail},
+        content=content,
+        headers=exc.headers,
     )
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import Optional, List
 from datetime import datetime
 
@@ -37,4 +37,8 @@ class AnalysisResponse(BaseModel):
     key_news: List[MarketData]
     trade_opportunities: List[TradeOpportunity]
     risks: List[str]
-    markdown_report: str
\ No newline at end of file
+    markdown_report: str
+
+# Batch validators for lists built from raw analysis/search dicts
+trade_opportunities_adapter = TypeAdapter(List[TradeOpportunity])
+market_data_adapter = TypeAdapter(List[MarketData])
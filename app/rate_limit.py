@@ -1,35 +1,105 @@
 from fastapi import HTTPException, Request, status
-from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
+import logging
+import math
+import secrets
+import time
+from typing import Tuple
+from redis.exceptions import RedisError
 from app.config import settings
+from app.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Sliding window over a sorted set: drop expired entries, count, then record.
+# Returns 0 when allowed, otherwise the seconds until the oldest entry expires.
+SLIDING_WINDOW_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+local count = redis.call('ZCARD', KEYS[1])
+if count >= tonumber(ARGV[3]) then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return math.floor(tonumber(oldest[2]) + tonumber(ARGV[5]) - tonumber(ARGV[2])) + 1
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 0
+"""
 
 # Simple in-memory rate limiter
 class RateLimiter:
     def __init__(self):
-        self.requests = defaultdict(list)
+        self.requests = defaultdict(deque)
     
-    def is_rate_limited(self, key: str) -> bool:
-        """Check if user has exceeded rate limit"""
-        now = datetime.now()
+    def is_rate_limited(self, key: str) -> Tuple[bool, int]:
+        """Check if user has exceeded rate limit, returning (limited, retry_after)"""
+        now = time.monotonic()
+        cutoff = now - settings.rate_limit_period
+        window = self.requests[key]
         # Clean old requests
-        self.requests[key] = [req_time for req_time in self.requests[key] 
-                             if now - req_time < timedelta(seconds=settings.rate_limit_period)]
+        while window and window[0] <= cutoff:
+            window.popleft()
         
         # Check if limit exceeded
-        if len(self.requests[key]) >= settings.rate_limit_requests:
-            return True
+        if len(window) >= settings.rate_limit_requests:
+            return True, math.floor(window[0] + settings.rate_limit_period - now) + 1
         
         # Add current request
-        self.requests[key].append(now)
-        return False
+        window.append(now)
+        return False, 0
+
+# Redis-backed rate limiter shared by all workers
+class RedisRateLimiter:
+    def __init__(self, redis):
+        self.redis = redis
+        self.script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+    
+    async def is_rate_limited(self, key: str) -> Tuple[bool, int]:
+        """Check if user has exceeded rate limit, returning (limited, retry_after)"""
+        now = time.time()
+        result = await self.script(
+            keys=[f"rate_limit:{key}"],
+            args=[
+                now - settings.rate_limit_period,
+                now,
+                settings.rate_limit_requests,
+                f"{now}-{secrets.token_hex(4)}",
+                settings.rate_limit_period,
+            ],
+        )
+        retry_after = int(result)
+        return retry_after > 0, retry_after
+
+def too_many_requests(code: str, message: str, retry_after: int) -> HTTPException:
+    """Build a 429 with the structured error body shared by all throttling paths"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={
+            "ok": False,
+            "code": code,
+            "message": message,
+            "retry_after": retry_after,
+        },
+        headers={"Retry-After": str(retry_after)}
+    )
 
 rate_limiter = RateLimiter()
+redis_rate_limiter = RedisRateLimiter(redis_client) if redis_client is not None else None
 
-def check_rate_limit(request: Request, user_identifier: str):
+async def check_rate_limit(request: Request, user_identifier: str):
     """Middleware to check rate limit"""
-    if rate_limiter.is_rate_limited(user_identifier):
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Rate limit exceeded. Try again in {settings.rate_limit_period} seconds.",
-            headers={"Retry-After": str(settings.rate_limit_period)}
-        )
\ No newline at end of file
+    if redis_rate_limiter is not None:
+        try:
+            limited, retry_after = await redis_rate_limiter.is_rate_limited(user_identifier)
+        except RedisError as e:
+            # Degrade to per-process limiting rather than failing the request
+            logger.warning(f"Redis rate limit check failed: {e}")
+            limited, retry_after = rate_limiter.is_rate_limited(user_identifier)
+    else:
+        limited, retry_after = rate_limiter.is_rate_limited(user_identifier)
+    
+    if limited:
+        raise too_many_requests(
+            "rate_limited",
+            f"Rate limit exceeded. Try again in {retry_after} seconds.",
+            retry_after
+        )
@@ -0,0 +1,17 @@
+from typing import Optional
+from redis.asyncio import Redis
+from app.config import settings
+
+# Shared Redis connection pool; None when REDIS_URL is not configured
+redis_client: Optional[Redis] = (
+    Redis.from_url(
+        settings.redis_url,
+        socket_connect_timeout=settings.redis_timeout,
+        socket_timeout=settings.redis_timeout,
+    )
+    if settings.redis_url else None
+)
+
+async def close_redis():
+    if redis_client is not None:
+        await redis_client.aclose()
@@ -1,30 +1,56 @@
 import httpx
+from async_lru import alru_cache
 from duckduckgo_search import DDGS
-from typing import List
+from typing import List, Tuple
 import asyncio
-from app.models import MarketData
+from app.models import MarketData, market_data_adapter
 from app.config import settings
 
-async def search_market_data(sector: str, max_results: int = 10) -> List[MarketData]:
+# (MarketData field, DDG result key, default)
+RESULT_FIELDS = (
+    ('title', 'title', ''),
+    ('source', 'source', 'Unknown'),
+    ('snippet', 'body', ''),
+    ('date', 'date', 'Recent'),
+    ('url', 'href', ''),
+)
+
+def _ddg_text(query: str, max_results: int) -> List[dict]:
+    """Blocking DuckDuckGo text search"""
+    with DDGS() as ddgs:
+        return list(ddgs.text(query, max_results=max_results))
+
+@alru_cache(maxsize=32, ttl=settings.cache_ttl)
+async def _fetch_market_data(sector: str, max_results: int) -> List[MarketData]:
+    """
+    Run the web search for a sector; raises on failure so errors are never cached
+    (cached per sector; concurrent calls for the same sector share one search)
+    """
+    # Use DuckDuckGo search for market news (run off the event loop)
+    query = f"{sector} sector India market news trends 2024 latest updates"
+    results = await asyncio.to_thread(_ddg_text, query, max_results)
+    
+    # Remap DDG keys to MarketData fields, then validate the whole list at once
+    return market_data_adapter.validate_python([
+        {
+            field: result.get(key, default)
+            for field, key, default in RESULT_FIELDS
+        }
+        for result in results
+    ])
+
+async def search_market_data(sector: str, max_results: int = 10) -> Tuple[List[MarketData], bool]:
     """
     Search for current market data and news about the sector
+    
+    Returns (market_data, degraded); degraded is True when the search failed
+    and static fallback data was substituted.
     """
     market_data = []
+    degraded = False
     
     try:
-        # Use DuckDuckGo search for market news
-        with DDGS() as ddgs:
-            query = f"{sector} sector India market news trends 2024 latest updates"
-            results = list(ddgs.text(query, max_results=max_results))
-            
-            for result in results:
-                market_data.append(MarketData(
-                    title=result.get('title', ''),
-                    source=result.get('source', 'Unknown'),
-                    snippet=result.get('body', ''),
-                    date=result.get('date', 'Recent'),
-                    url=result.get('href', '')
-                ))
+        market_data = await _fetch_market_data(sector, max_results)
         
         # Additional API calls can be added here for more data sources
         # Example: Financial news APIs, stock market APIs, etc.
@@ -33,8 +59,9 @@ async def search_market_data(sector: str, max_results: int = 10) -> List[MarketD
         # Fallback to static data if search fails
         print(f"Search failed: {e}")
         market_data = get_fallback_data(sector)
+        degraded = True
     
-    return market_data
+    return market_data, degraded
 
 def get_fallback_data(sector: str) -> List[MarketData]:
     """Provide fallback data if web search fails"""